@@ -1,34 +1,94 @@
-import json
+import asyncio
+import hashlib
 import logging
 import re
-import warnings
-from io import BytesIO
+import time
 
+import faiss
+import fitz
+import numpy as np
+import orjson
 import streamlit as st
-from openai import OpenAI
-from pypdf import PdfReader
-from pypdf.errors import PdfReadWarning
+from diskcache import Cache
+from openai import AsyncOpenAI, OpenAI
 
-warnings.filterwarnings("ignore", category=PdfReadWarning)
-logging.getLogger("pypdf").setLevel(logging.ERROR)
-logging.getLogger("PyPDF2").setLevel(logging.ERROR)
+fitz.TOOLS.mupdf_display_errors(False)
 logging.getLogger(__name__).setLevel(logging.INFO)
 
+PDF_MAX_PAGES = 20
+PDF_MAX_CHARS = 50_000
+CACHE_DIR = ".llm_cache"
+CACHE_TTL = 86400
+CACHE_MAX_TEMPERATURE = 0.2
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_DIM = 1536
+SEMANTIC_THRESHOLD = 0.92
+
+_BULLET_RE = re.compile(r"[\u2022\u00b7\u2027\u25aa\u25cf]")
+_DASH_RE = re.compile(r"\s+-\s+")
+_SENT_RE = re.compile(r"(?<=[.!?])\s+")
+_LEADING_BULLET_RE = re.compile(r"^[\-\u2022\u00b7\u2027\u25aa\u25cf]\s*")
+_PAGE_NUMBER_LINE_RE = re.compile(
+    r"^[ \t]*(?:page[ \t]+\d{1,3}(?:[ \t]*(?:/|of)[ \t]*\d{1,3})?"
+    r"|\d{1,3}[ \t]+of[ \t]+\d{1,3})[ \t]*$",
+    re.I | re.M,
+)
+_INLINE_SPACE_RE = re.compile(r"[^\S\n]+")
+_NEWLINES_RE = re.compile(r"\s*\n\s*")
+_ENTITY_RE = re.compile(
+    r"[A-Z][A-Za-z]*(?:\+\+|#)?(?:[^\S\n]+[A-Z][A-Za-z]*(?:\+\+|#)?)*|\d+"
+)
+_NUMBER_WORD_RE = re.compile(
+    r"\b(?:two|three|four|five|six|seven|eight|nine|ten|eleven|twelve|fifteen"
+    r"|twenty|thirty|forty|fifty|hundred|dozen)\b",
+    re.I,
+)
+_TOKEN_RE = re.compile(r"\w+(?:\+\+|#)?")
+_LOWER_WORD_RE = re.compile(r"\b[a-z]+\b")
+_LETTER_WORDS = frozenset(
+    {
+        "dear",
+        "sincerely",
+        "regards",
+        "kind",
+        "best",
+        "yours",
+        "faithfully",
+        "hiring",
+        "manager",
+        "team",
+        "sir",
+        "madam",
+        "i",
+    }
+)
+
+
+def strip_page_number(text: str, number: int) -> str:
+    marks = {str(number), f"- {number} -", f"-{number}-"}
+    lines = text.strip().split("\n")
+    if lines and lines[-1].strip() in marks:
+        lines.pop()
+    if lines and lines[0].strip() in marks:
+        lines.pop(0)
+    return "\n".join(lines)
+
 
-def read_pdf_bytes(data: bytes) -> str:
-    reader = PdfReader(BytesIO(data))
+def read_pdf_bytes(data: bytes, max_pages: int = PDF_MAX_PAGES) -> str:
     texts = []
-    for page in reader.pages:
-        text = page.extract_text() or ""
-        texts.append(text)
+    total = 0
+    with fitz.open(stream=data, filetype="pdf") as doc:
+        for i, page in enumerate(doc):
+            if i >= max_pages or total > PDF_MAX_CHARS:
+                break
+            text = strip_page_number(page.get_text(), i + 1)
+            texts.append(text)
+            total += len(text)
     return "\n".join(texts).strip()
 
 
-def read_uploaded(uploaded_file) -> str:
-    if uploaded_file is None:
-        return ""
-    data = uploaded_file.getvalue()
-    name = (uploaded_file.name or "").lower()
+@st.cache_data(max_entries=16, show_spinner=False)
+def decode_uploaded(data: bytes, name: str) -> str:
     if name.endswith(".pdf"):
         return read_pdf_bytes(data)
     try:
@@ -37,27 +97,271 @@ def read_uploaded(uploaded_file) -> str:
         return data.decode("latin-1", errors="ignore").strip()
 
 
+def read_uploaded(uploaded_file) -> str:
+    if uploaded_file is None:
+        return ""
+    data = uploaded_file.getvalue()
+    name = (uploaded_file.name or "").lower()
+    return decode_uploaded(data, name)
+
+
 def pick_input(text_value: str, file_value) -> str:
     if text_value and text_value.strip():
         return text_value.strip()
     return read_uploaded(file_value)
 
 
-def chat(client: OpenAI, model: str, system: str, user: str, temperature: float = 0.0) -> str:
+@st.cache_resource
+def llm_cache() -> Cache:
+    return Cache(CACHE_DIR)
+
+
+def cache_key(
+    model: str, system: str, user: str, temperature: float, response_format: dict | None = None
+) -> str:
+    payload = orjson.dumps(
+        {"m": model, "s": system, "u": user, "t": temperature, "f": response_format},
+        option=orjson.OPT_SORT_KEYS,
+    )
+    return hashlib.sha256(payload).hexdigest()
+
+
+def semantic_cache() -> dict:
+    if "semantic_entries" not in st.session_state:
+        st.session_state.semantic_entries = {
+            "index": faiss.IndexFlatIP(EMBEDDING_DIM),
+            "entries": [],
+        }
+    cache = st.session_state.semantic_entries
+    now = time.time()
+    live = [entry for entry in cache["entries"] if now - entry["created"] < CACHE_TTL]
+    if len(live) != len(cache["entries"]):
+        index = faiss.IndexFlatIP(EMBEDDING_DIM)
+        if live:
+            index.add(np.vstack([entry["vector"] for entry in live]))
+        cache["index"], cache["entries"] = index, live
+    return cache
+
+
+def unit_vector(resp) -> np.ndarray:
+    vec = np.asarray([resp.data[0].embedding], dtype="float32")
+    faiss.normalize_L2(vec)
+    return vec
+
+
+def embedding_args(system: str, user: str) -> dict:
+    return {"model": EMBEDDING_MODEL, "input": f"{system}\n\n{user}"}
+
+
+def embedding_failed(exc: Exception) -> None:
+    logging.getLogger(__name__).warning("Embedding request failed: %s", type(exc).__name__)
+
+
+def embed_prompt(client: OpenAI, system: str, user: str) -> np.ndarray | None:
+    try:
+        return unit_vector(client.embeddings.create(**embedding_args(system, user)))
+    except Exception as exc:  # noqa: BLE001
+        embedding_failed(exc)
+        return None
+
+
+async def aembed_prompt(client: AsyncOpenAI, system: str, user: str) -> np.ndarray | None:
+    try:
+        return unit_vector(await client.embeddings.create(**embedding_args(system, user)))
+    except Exception as exc:  # noqa: BLE001
+        embedding_failed(exc)
+        return None
+
+
+def semantic_scope(model: str, system: str, response_format: dict | None) -> dict:
+    return {"model": model, "system": system, "response_format": response_format}
+
+
+def semantic_lookup(vec: np.ndarray, scope: dict) -> str | None:
+    cache = semantic_cache()
+    if cache["index"].ntotal == 0:
+        return None
+    scores, ids = cache["index"].search(vec, 1)
+    entry = cache["entries"][ids[0][0]]
+    if scores[0][0] > SEMANTIC_THRESHOLD and entry["scope"] == scope:
+        return entry["content"]
+    return None
+
+
+def semantic_store(vec: np.ndarray, scope: dict, content: str) -> None:
+    cache = semantic_cache()
+    cache["index"].add(vec)
+    cache["entries"].append(
+        {"scope": scope, "content": content, "vector": vec, "created": time.time()}
+    )
+
+
+def cache_enabled(temperature: float) -> bool:
+    return bool(st.session_state.get("use_cache")) and temperature <= CACHE_MAX_TEMPERATURE
+
+
+def semantic_enabled(temperature: float) -> bool:
+    return bool(st.session_state.get("semantic_cache")) and temperature == 0.0
+
+
+def response_key(
+    model: str, system: str, user: str, temperature: float, response_format: dict | None = None
+) -> str | None:
+    if not cache_enabled(temperature):
+        return None
+    return cache_key(model, system, user, temperature, response_format)
+
+
+def cached_response(key: str | None) -> str | None:
+    return llm_cache().get(key) if key else None
+
+
+def store_response(key: str | None, content: str) -> None:
+    if key and content:
+        llm_cache().set(key, content, expire=CACHE_TTL)
+
+
+def completion_args(
+    model: str, system: str, user: str, temperature: float, response_format: dict | None = None
+) -> dict:
+    args = {
+        "model": model,
+        "temperature": temperature,
+        "messages": [
+            {"role": "system", "content": system},
+            {"role": "user", "content": user},
+        ],
+    }
+    if response_format is not None:
+        args["response_format"] = response_format
+    return args
+
+
+def chat_failed(exc: Exception) -> None:
+    logging.getLogger(__name__).error("OpenAI API error: %s", type(exc).__name__)
+    st.error("OpenAI request failed. Check your API key and try again.")
+    st.stop()
+
+
+def semantic_response(vec: np.ndarray | None, scope: dict) -> str | None:
+    if vec is None:
+        return None
+    return semantic_lookup(vec, scope)
+
+
+def store_completion(key: str | None, vec: np.ndarray | None, scope: dict, resp) -> str:
+    content = resp.choices[0].message.content.strip()
+    if vec is not None:
+        semantic_store(vec, scope, content)
+    store_response(key, content)
+    return content
+
+
+def chat(
+    client: OpenAI,
+    model: str,
+    system: str,
+    user: str,
+    temperature: float = 0.0,
+    response_format: dict | None = None,
+    semantic: bool = False,
+) -> str:
+    key = response_key(model, system, user, temperature, response_format)
+    content = cached_response(key)
+    if content is not None:
+        return content
+    scope = semantic_scope(model, system, response_format)
+    vec = None
+    if key and semantic and semantic_enabled(temperature):
+        vec = embed_prompt(client, system, user)
+        content = semantic_response(vec, scope)
+        if content is not None:
+            return content
     try:
         resp = client.chat.completions.create(
-            model=model,
-            temperature=temperature,
-            messages=[
-                {"role": "system", "content": system},
-                {"role": "user", "content": user},
-            ],
+            **completion_args(model, system, user, temperature, response_format)
         )
-        return resp.choices[0].message.content.strip()
     except Exception as exc:  # noqa: BLE001
-        logging.getLogger(__name__).error("OpenAI API error: %s", type(exc).__name__)
-        st.error("OpenAI request failed. Check your API key and try again.")
-        st.stop()
+        chat_failed(exc)
+    return store_completion(key, vec, scope, resp)
+
+
+async def achat(
+    client: AsyncOpenAI,
+    model: str,
+    system: str,
+    user: str,
+    temperature: float = 0.0,
+    response_format: dict | None = None,
+    semantic: bool = False,
+) -> str:
+    key = response_key(model, system, user, temperature, response_format)
+    content = cached_response(key)
+    if content is not None:
+        return content
+    scope = semantic_scope(model, system, response_format)
+    vec = None
+    if key and semantic and semantic_enabled(temperature):
+        vec = await aembed_prompt(client, system, user)
+        content = semantic_response(vec, scope)
+        if content is not None:
+            return content
+    try:
+        resp = await client.chat.completions.create(
+            **completion_args(model, system, user, temperature, response_format)
+        )
+    except Exception as exc:  # noqa: BLE001
+        chat_failed(exc)
+    return store_completion(key, vec, scope, resp)
+
+
+def stream_chat(
+    client: OpenAI,
+    model: str,
+    system: str,
+    user: str,
+    temperature: float = 0.0,
+):
+    key = response_key(model, system, user, temperature)
+    content = cached_response(key)
+    if content is not None:
+        yield content
+        return
+    parts = []
+    try:
+        resp = client.chat.completions.create(
+            **completion_args(model, system, user, temperature), stream=True
+        )
+        for chunk in resp:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content or ""
+            if delta:
+                parts.append(delta)
+                yield delta
+    except Exception as exc:  # noqa: BLE001
+        chat_failed(exc)
+    store_response(key, "".join(parts).strip())
+
+
+async def chat_all(
+    api_key: str, model: str, prompts: list[tuple[str, str, dict | None]]
+) -> list[str]:
+    async with AsyncOpenAI(api_key=api_key) as client:
+        return await asyncio.gather(
+            *(
+                achat(
+                    client,
+                    model,
+                    system,
+                    user,
+                    temperature=0.0,
+                    response_format=response_format,
+                    semantic=True,
+                )
+                for system, user, response_format in prompts
+            )
+        )
 
 
 def excerpt_bullets(text: str, limit: int = 500) -> str:
@@ -71,14 +375,14 @@ def excerpt_bullets(text: str, limit: int = 500) -> str:
             snippet = snippet[:cut] + "..."
         else:
             snippet = snippet + "..."
-    snippet = re.sub(r"[\u2022\u00b7\u2027\u25aa\u25cf]", "\n", snippet)
-    snippet = re.sub(r"\s+-\s+", "\n", snippet)
+    snippet = _BULLET_RE.sub("\n", snippet)
+    snippet = _DASH_RE.sub("\n", snippet)
     lines = [line.strip() for line in snippet.splitlines() if line.strip()]
     if not lines:
         lines = [snippet]
     expanded = []
     for line in lines:
-        parts = [p.strip() for p in re.split(r"(?<=[.!?])\s+", line) if p.strip()]
+        parts = [p.strip() for p in _SENT_RE.split(line) if p.strip()]
         expanded.extend(parts if parts else [line])
     if len(expanded) == 1 and len(expanded[0]) > 140:
         chunks = []
@@ -96,6 +400,33 @@ def excerpt_bullets(text: str, limit: int = 500) -> str:
     return "\n".join(f"- {line}" for line in expanded)
 
 
+def compact_text(text: str, max_chars: int = 6000) -> str:
+    if not text:
+        return ""
+    compacted = _PAGE_NUMBER_LINE_RE.sub("", text)
+    compacted = _INLINE_SPACE_RE.sub(" ", compacted)
+    compacted = _NEWLINES_RE.sub("\n", compacted).strip()
+    if len(compacted) <= max_chars:
+        return compacted
+    snippet = compacted[:max_chars]
+    cut = max(snippet.rfind(mark) for mark in (". ", "! ", "? ", ".\n", "!\n", "?\n"))
+    if cut > max_chars // 2:
+        return snippet[: cut + 1]
+    cut = snippet.rfind(" ")
+    if cut > 0:
+        return snippet[:cut] + "..."
+    return snippet + "..."
+
+
+def truncate_text(text: str, limit: int) -> str:
+    if len(text) <= limit:
+        return text
+    cut = max(text.rfind(" ", 0, limit), text.rfind("\n", 0, limit))
+    if cut <= 0:
+        cut = limit
+    return text[:cut].rstrip() + "…"
+
+
 def normalize_requirements(reqs) -> list[str]:
     if isinstance(reqs, list):
         items = reqs
@@ -105,45 +436,77 @@ def normalize_requirements(reqs) -> list[str]:
         items = []
     cleaned = []
     for item in items:
+        if not isinstance(item, str):
+            continue
         text = item.strip()
         if not text:
             continue
-        text = re.sub(r"^[\-\u2022\u00b7\u2027\u25aa\u25cf]\s*", "", text)
+        text = _LEADING_BULLET_RE.sub("", text)
         cleaned.append(text)
     return cleaned
 
 
-def parse_jd_summary(text: str) -> dict | None:
-    if not text:
-        return None
-    cleaned = text.strip()
-    cleaned = re.sub(r"^```(?:json)?\s*", "", cleaned, flags=re.I)
-    cleaned = re.sub(r"\s*```$", "", cleaned)
+def starts_sentence(text: str, pos: int) -> bool:
+    before = text[:pos].rstrip(" \t\"'(")
+    return not before or before[-1] in ".!?:\n"
+
+
+def ungrounded_entities(letter: str, sources: list[str]) -> set[str]:
+    grounded = set()
+    for source in sources:
+        grounded.update(_TOKEN_RE.findall(source))
+    common = set()
+    for text in (letter, *sources):
+        common.update(_LOWER_WORD_RE.findall(text))
+    ungrounded = set()
+    for match in _ENTITY_RE.finditer(letter):
+        words = match.group(0).split()
+        if starts_sentence(letter, match.start()) and words[0].lower() in common:
+            words = words[1:]
+        ungrounded.update(
+            word for word in words if word not in grounded and word.lower() not in _LETTER_WORDS
+        )
+    grounded_lower = {word.lower() for word in grounded}
+    ungrounded.update(
+        word for word in _NUMBER_WORD_RE.findall(letter) if word.lower() not in grounded_lower
+    )
+    return ungrounded
+
+
+def load_json_object(text: str) -> dict:
     try:
-        return json.loads(cleaned)
-    except json.JSONDecodeError:
-        match = re.search(r"\{.*\}", cleaned, flags=re.S)
-        if match:
-            try:
-                return json.loads(match.group(0))
-            except json.JSONDecodeError:
-                return None
-    return None
+        data = orjson.loads(text.encode("utf-8"))
+    except orjson.JSONDecodeError:
+        return {}
+    return data if isinstance(data, dict) else {}
 
 
-def fallback_requirements(text: str, limit: int = 10) -> list[str]:
-    if not text:
+def normalize_items(items, join_fields: bool = False) -> list[str]:
+    if not isinstance(items, list):
         return []
-    lines = []
-    for raw in text.splitlines():
-        line = raw.strip().strip(",")
-        if not line or line in {"{", "}", "[", "]"}:
+    cleaned = []
+    for item in items:
+        if join_fields and isinstance(item, dict):
+            item = " | ".join(
+                str(value).strip()
+                for value in item.values()
+                if isinstance(value, (str, int, float))
+                and not isinstance(value, bool)
+                and str(value).strip()
+            )
+        if not isinstance(item, str):
             continue
-        line = line.strip('"')
-        line = re.sub(r'^(company_name|role_title|requirements)\s*:\s*', '', line, flags=re.I)
-        if line:
-            lines.append(line)
-    return lines[:limit]
+        text = _LEADING_BULLET_RE.sub("", item.strip())
+        if text:
+            cleaned.append(text)
+    return cleaned
+
+
+def parse_cv_data(text: str) -> tuple[list[str], list[str]]:
+    data = load_json_object(text)
+    facts = normalize_items(data.get("facts"))
+    recent_jobs = normalize_items(data.get("recent_jobs"), join_fields=True)
+    return facts, recent_jobs
 
 
 st.set_page_config(page_title="Job Letter Generator", page_icon="📝", layout="centered")
@@ -158,6 +521,22 @@ api_key = st.sidebar.text_input(
     "OpenAI API Key", type="password", help="Stored only in this session."
 )
 model = st.sidebar.selectbox("Model", ["gpt-4o-mini"], index=0)
+use_cache = st.sidebar.checkbox(
+    "Use cache",
+    value=True,
+    key="use_cache",
+    help="Reuse responses for identical inputs for up to 24 hours.",
+)
+st.sidebar.checkbox(
+    "Semantic cache",
+    value=False,
+    key="semantic_cache",
+    disabled=not use_cache,
+    help=(
+        "Also reuse extraction responses for near-identical inputs within this session "
+        "(embedding similarity). Requires \"Use cache\"."
+    ),
+)
 st.sidebar.subheader("Inputs")
 cv_file = st.sidebar.file_uploader("CV (PDF or TXT)", type=["pdf", "txt"])
 
@@ -194,32 +573,41 @@ if generate:
         st.stop()
 
     client = OpenAI(api_key=api_key)
+    cv_prompt = compact_text(cv_input)
+    jd_prompt = compact_text(jd_input)
+
+    jd_system = "You extract structured info from a job description."
+    jd_user = (
+        "Return a JSON object with keys: company_name, role_title, contact_name, requirements.\n"
+        "contact_name is the contact person named in the JD, or an empty string if there is none.\n"
+        "Requirements must be a list of short strings, only what is explicitly in the JD.\n\n"
+        f"JD:\n{jd_prompt}\n"
+    )
+    cv_system = "You extract CV data."
+    cv_user = (
+        "Return a JSON object with keys: facts, recent_jobs.\n"
+        "facts: a list of short strings, each one explicit fact from the CV text. "
+        "Do not infer, generalize, or add info; every fact must be present in the CV text.\n"
+        "recent_jobs: a list of up to 3 most recent job stations, one string per station "
+        "in this format:\n"
+        "YYYY–YYYY | Role | Company\n"
+        "Only use explicit info from the CV. If a field is missing, omit it.\n\n"
+        f"CV:\n{cv_prompt}\n"
+    )
 
-    with st.spinner("Extracting job description summary..."):
-        jd_system = "You extract structured info from a job description."
-        jd_user = (
-            "Return JSON with keys: company_name, role_title, requirements.\n"
-            "Requirements must be a list of short strings, only what is explicitly in the JD.\n\n"
-            f"JD:\n{jd_input}\n"
+    with st.spinner("Extracting job description summary, CV facts and recent job stations..."):
+        jd_json_text, cv_json_text = asyncio.run(
+            chat_all(
+                api_key,
+                model,
+                [
+                    (jd_system, jd_user, {"type": "json_object"}),
+                    (cv_system, cv_user, {"type": "json_object"}),
+                ],
+            )
         )
-        jd_json_text = chat(client, model, jd_system, jd_user, temperature=0.0)
-        jd_summary = parse_jd_summary(jd_json_text)
-        if jd_summary is None:
-            jd_summary = {"requirements": fallback_requirements(jd_json_text)}
-
-    with st.spinner("Extracting CV facts..."):
-        facts_system = "You extract factual statements from a CV."
-        facts_user = (
-            "Extract only explicit facts from the CV text. Do not infer, generalize, or add info.\n"
-            "Return a bullet list. Each bullet should be one short fact and must be present in the CV text.\n\n"
-            f"CV:\n{cv_input}\n"
-        )
-        facts_text = chat(client, model, facts_system, facts_user, temperature=0.0)
-        facts = [
-            line[2:].strip()
-            for line in facts_text.splitlines()
-            if line.strip().startswith("- ")
-        ]
+        jd_summary = load_json_object(jd_json_text)
+        facts, recent_jobs = parse_cv_data(cv_json_text)
 
     if not facts:
         st.error("No facts extracted. Check the CV input or try a different file.")
@@ -227,53 +615,49 @@ if generate:
 
     facts_block = "\n".join("- " + f for f in facts)
 
-    with st.spinner("Extracting recent job stations..."):
-        jobs_system = "You extract recent job stations from a CV."
-        jobs_user = (
-            "Extract up to 3 most recent job stations from the CV.\n"
-            "Return a bullet list with one station per bullet in this format:\n"
-            "YYYY–YYYY | Role | Company\n"
-            "Only use explicit info from the CV. If a field is missing, omit it.\n\n"
-            f"CV:\n{cv_input}\n"
-        )
-        jobs_text = chat(client, model, jobs_system, jobs_user, temperature=0.0)
-        recent_jobs = [
-            line[2:].strip()
-            for line in jobs_text.splitlines()
-            if line.strip().startswith("- ")
-        ]
+    example_block = truncate_text(letter_input, 1000) if letter_input else "[none]"
+
+    letter_system = "You write job application letters using only provided facts."
+    letter_user = (
+        "Write a one-page job application letter (about 250-350 words).\n\n"
+        "Constraints:\n"
+        "- Use ONLY candidate facts from FACTS.\n"
+        "- Do NOT add any new candidate information, dates, skills, or claims not in FACTS.\n"
+        "- It is OK to mention the company name and role from the job description.\n"
+        "- If a requirement from the job description is not supported by FACTS, do not mention it.\n"
+        "- Use more recent FACTS rather than older ones.\n"
+        "- Use the name of the contact person in the greeting, if available.\n"
+        "- Use the example letter ONLY for tone/structure, not for facts.\n"
+        "- Output plain text, no markdown.\n\n"
+        f"JOB DESCRIPTION:\n{jd_prompt}\n\n"
+        f"FACTS:\n{facts_block}\n\n"
+        f"EXAMPLE LETTER (style only):\n{example_block}\n"
+    )
+    draft_area = st.empty()
+    draft_letter = draft_area.write_stream(
+        stream_chat(client, model, letter_system, letter_user, temperature=0.2)
+    ).strip()
+    if not draft_letter:
+        st.error("The model returned an empty draft. Try generating the letter again.")
+        st.stop()
 
-    example_block = letter_input if letter_input else "[none]"
-
-    with st.spinner("Drafting letter..."):
-        letter_system = "You write job application letters using only provided facts."
-        letter_user = (
-            "Write a one-page job application letter (about 250-350 words).\n\n"
-            "Constraints:\n"
-            "- Use ONLY candidate facts from FACTS.\n"
-            "- Do NOT add any new candidate information, dates, skills, or claims not in FACTS.\n"
-            "- It is OK to mention the company name and role from the job description.\n"
-            "- If a requirement from the job description is not supported by FACTS, do not mention it.\n"
-            "- Use more recent FACTS rather than older ones.\n"
-            "- Use the name of the contact person in the greeting, if available.\n"
-            "- Use the example letter ONLY for tone/structure, not for facts.\n"
-            "- Output plain text, no markdown.\n\n"
-            f"JOB DESCRIPTION:\n{jd_input}\n\n"
-            f"FACTS:\n{facts_block}\n\n"
-            f"EXAMPLE LETTER (style only):\n{example_block}\n"
-        )
-        draft_letter = chat(client, model, letter_system, letter_user, temperature=0.2)
-
-    with st.spinner("Verifying facts..."):
-        verify_system = "You are a strict factual editor."
-        verify_user = (
-            "Remove or rewrite any sentence that introduces candidate info not present in FACTS.\n"
-            "If a sentence cannot be fully supported by FACTS, delete it.\n"
-            "Return only the revised letter as plain text.\n\n"
-            f"FACTS:\n{facts_block}\n\n"
-            f"LETTER:\n{draft_letter}\n"
-        )
-        final_letter = chat(client, model, verify_system, verify_user, temperature=0.0)
+    grounding = [facts_block] + [
+        str(jd_summary.get(key) or "") for key in ("company_name", "role_title", "contact_name")
+    ]
+    if ungrounded_entities(draft_letter, grounding):
+        with st.spinner("Verifying facts..."):
+            verify_system = "You are a strict factual editor."
+            verify_user = (
+                "Remove or rewrite any sentence that introduces candidate info not present in FACTS.\n"
+                "If a sentence cannot be fully supported by FACTS, delete it.\n"
+                "Return only the revised letter as plain text.\n\n"
+                f"FACTS:\n{facts_block}\n\n"
+                f"LETTER:\n{draft_letter}\n"
+            )
+            final_letter = chat(client, model, verify_system, verify_user, temperature=0.0)
+    else:
+        final_letter = draft_letter
+    draft_area.empty()
 
     st.session_state.final_letter = final_letter
     st.session_state.facts_block = facts_block
@@ -282,24 +666,28 @@ if generate:
 
 if st.session_state.final_letter:
     st.subheader("CV Information")
-    if st.session_state.recent_jobs:
-        st.markdown("\n".join(f"- {job}" for job in st.session_state.recent_jobs))
-    else:
-        st.markdown("- [not found]")
-    st.markdown("Extracted facts")
-    st.markdown(st.session_state.facts_block)
+    cv_sections = [
+        "\n".join(f"- {job}" for job in st.session_state.recent_jobs) or "- [not found]",
+        "Extracted facts",
+        st.session_state.facts_block,
+    ]
+    st.markdown("\n\n".join(cv_sections))
 
     st.subheader("Job description summary")
     company = st.session_state.jd_summary.get("company_name") or "[not found]"
     role = st.session_state.jd_summary.get("role_title") or "[not found]"
     requirements = normalize_requirements(st.session_state.jd_summary.get("requirements"))
-    st.markdown(f"- Company: {company}")
-    st.markdown(f"- Role: {role}")
+    summary_lines = [f"- Company: {company}", f"- Role: {role}"]
     if requirements:
-        st.markdown("Requirements")
-        st.markdown("\n".join(f"- {req}" for req in requirements))
+        jd_sections = [
+            "\n".join(summary_lines),
+            "Requirements",
+            "\n".join(f"- {req}" for req in requirements),
+        ]
     else:
-        st.markdown("- Requirements: [not found]")
+        summary_lines.append("- Requirements: [not found]")
+        jd_sections = ["\n".join(summary_lines)]
+    st.markdown("\n\n".join(jd_sections))
 
     st.subheader("Final letter")
     st.text_area("Output", value=st.session_state.final_letter, height=360)
@@ -0,0 +1,109 @@
+import pytest
+
+pytest.importorskip("streamlit")
+pytest.importorskip("faiss")
+pytest.importorskip("fitz")
+pytest.importorskip("diskcache")
+pytest.importorskip("openai")
+
+import app  # noqa: E402
+
+
+def test_compact_text_keeps_date_lines():
+    text = "Jane Doe\nSoftware Engineer\n03/19\n05/21\nAcme Corp"
+    assert app.compact_text(text) == text
+
+
+def test_compact_text_drops_page_markers():
+    text = "Jane Doe\nPage 2 of 3\nAcme Corp\n3 of 3"
+    assert app.compact_text(text) == "Jane Doe\nAcme Corp"
+
+
+def test_strip_page_number_only_drops_the_current_page_number():
+    assert app.strip_page_number("Languages\nGerman Level\n5\n", 1) == "Languages\nGerman Level\n5"
+    assert app.strip_page_number("2\nAcme Corp\n- 2 -\n", 2) == "Acme Corp"
+
+
+def test_parse_cv_data_drops_non_string_facts_and_joins_job_fields():
+    text = (
+        '{"facts": ["Built Python services", {"skill": "Go"}], '
+        '"recent_jobs": [{"years": "2019–2021", "role": "Engineer", "company": "Acme"}]}'
+    )
+    facts, recent_jobs = app.parse_cv_data(text)
+    assert facts == ["Built Python services"]
+    assert recent_jobs == ["2019–2021 | Engineer | Acme"]
+
+
+def test_normalize_items_skips_booleans_in_job_fields():
+    items = [{"years": "2019", "current": True, "fte": 0.8}]
+    assert app.normalize_items(items, join_fields=True) == ["2019 | 0.8"]
+
+
+def test_ungrounded_entities_flags_jd_skills_acronyms_and_numbers():
+    facts = "- Software Engineer at Acme Corp 2019-2021"
+    grounding = [facts, "Globex", "Backend Engineer", ""]
+    draft = (
+        "I have extensive Kubernetes experience, hold an MBA "
+        "and have 10 years of AWS expertise."
+    )
+    assert app.ungrounded_entities(draft, grounding) == {"Kubernetes", "MBA", "10", "AWS"}
+
+
+def test_ungrounded_entities_accepts_grounded_draft():
+    facts = "- Jane Doe\n- Software Engineer at Acme Corp 2019-2021"
+    grounding = [facts, "Globex", "Backend Engineer", "Laura Smith"]
+    draft = (
+        "Dear Laura Smith,\n\n"
+        "I am applying for the Backend Engineer role at Globex. "
+        "I worked as a Software Engineer at Acme Corp from 2019 to 2021. "
+        "From that role I bring a focus on reliable services.\n\n"
+        "Kind regards,\nJane Doe"
+    )
+    assert app.ungrounded_entities(draft, grounding) == set()
+
+
+def test_ungrounded_entities_does_not_excuse_jd_skills_at_sentence_start():
+    facts = "- Software Engineer at Acme Corp 2019-2021"
+    draft = "Kubernetes is something I have used daily."
+    assert app.ungrounded_entities(draft, [facts, "Globex", "", ""]) == {"Kubernetes"}
+
+
+def test_ungrounded_entities_flags_single_letters_and_number_words():
+    facts = "- Software Engineer at Acme Corp 2019-2021\n- Wrote Python tools"
+    draft = "I have written C++ and R at Acme Corp for five years, alongside Python."
+    assert app.ungrounded_entities(draft, [facts]) == {"C++", "R", "five"}
+
+
+def test_truncate_text_keeps_paragraph_breaks():
+    letter = "Dear X,\n\nI am writing.\n\nKind regards,\nJane"
+    assert app.truncate_text(letter, 1000) == letter
+    assert app.truncate_text(letter, 20) == "Dear X,\n\nI am…"
+
+
+class FakeCache(dict):
+    def set(self, key, value, expire=None):
+        self[key] = value
+
+
+def test_semantic_hit_is_not_copied_into_exact_cache(monkeypatch):
+    fake_cache = FakeCache()
+    monkeypatch.setattr(app, "llm_cache", lambda: fake_cache)
+    monkeypatch.setattr(app, "cache_enabled", lambda temperature: True)
+    monkeypatch.setattr(app, "semantic_enabled", lambda temperature: True)
+    monkeypatch.setattr(app, "embed_prompt", lambda client, system, user: object())
+    monkeypatch.setattr(app, "semantic_lookup", lambda vec, scope: "facts from another CV")
+    content = app.chat(None, "gpt-4o-mini", "system", "user", semantic=True)
+    assert content == "facts from another CV"
+    assert fake_cache == {}
+
+
+def test_semantic_lookup_requires_matching_system_and_response_format(monkeypatch):
+    cache = {"index": app.faiss.IndexFlatIP(app.EMBEDDING_DIM), "entries": []}
+    monkeypatch.setattr(app, "semantic_cache", lambda: cache)
+    vec = app.np.ones((1, app.EMBEDDING_DIM), dtype="float32")
+    app.faiss.normalize_L2(vec)
+    scope = app.semantic_scope("gpt-4o-mini", "You extract CV data.", {"type": "json_object"})
+    app.semantic_store(vec, scope, "cv facts")
+    assert app.semantic_lookup(vec, scope) == "cv facts"
+    other = app.semantic_scope("gpt-4o-mini", "You are a strict factual editor.", None)
+    assert app.semantic_lookup(vec, other) is None